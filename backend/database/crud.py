@@ -1,51 +1,85 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import exists, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from . import models
 
-def get_deployment_by_id(db: Session, deployment_id: int):
-    return db.query(models.Deployment).filter(models.Deployment.id == deployment_id).first()
+async def get_deployment_by_id(db: AsyncSession, deployment_id: int):
+    return (await db.scalars(select(models.Deployment).where(models.Deployment.id == deployment_id))).first()
 
-def get_deployment_by_name(db: Session, deployment_name: str):
-    return db.query(models.Deployment).filter(models.Deployment.deployment_name == deployment_name).first()
+async def get_deployment_by_name(db: AsyncSession, deployment_name: str):
+    return (await db.scalars(select(models.Deployment).where(models.Deployment.deployment_name == deployment_name))).first()
 
-def get_deployments(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Deployment).order_by(models.Deployment.created_at.desc()).offset(skip).limit(limit).all()
+async def deployment_exists(db: AsyncSession, deployment_name: str) -> bool:
+    return await db.scalar(select(exists().where(models.Deployment.deployment_name == deployment_name)))
 
-def create_deployment(db: Session, deployment_name: str, repo_url: str, encrypted_pat_token: str | None, language: str, push_enabled: bool, status: str = "Created"):
-    db_deployment = models.Deployment(
-        deployment_name=deployment_name,
-        repo_url=repo_url,
-        encrypted_pat_token=encrypted_pat_token,
-        language=language,
-        push_enabled=push_enabled,
-        status=status
+async def get_deployments(db: AsyncSession, skip: int = 0, limit: int = 100):
+    """
+    Lists deployments newest first. Only the summary columns are selected so
+    the query is served from ix_deployment_created_desc.
+    """
+    stmt = (
+        select(
+            models.Deployment.id,
+            models.Deployment.deployment_name,
+            models.Deployment.status,
+            models.Deployment.created_at,
+        )
+        .order_by(models.Deployment.created_at.desc())
+        .offset(skip)
+        .limit(limit)
     )
-    db.add(db_deployment)
-    db.commit()
-    db.refresh(db_deployment)
+    return (await db.execute(stmt)).all()
+
+async def create_deployment(db: AsyncSession, deployment_name: str, repo_url: str, encrypted_pat_token: str | None, language: str, push_enabled: bool, status: str = "Created"):
+    """
+    Inserts a deployment with a single INSERT ... RETURNING, so the
+    server-generated id and created_at come back without a second query.
+    """
+    stmt = (
+        insert(models.Deployment)
+        .values(
+            deployment_name=deployment_name,
+            repo_url=repo_url,
+            encrypted_pat_token=encrypted_pat_token,
+            language=language,
+            push_enabled=push_enabled,
+            status=status
+        )
+        .returning(models.Deployment)
+    )
+    db_deployment = (await db.scalars(stmt)).one()
+    await db.commit()
     return db_deployment
 
-def update_deployment_grafana_links(db: Session, deployment_name: str, links: str):
+async def update_deployment_grafana_links(db: AsyncSession, deployment_name: str, links: str):
     """
     Updates the Grafana panel links for a specific deployment.
+    Returns the number of rows updated.
     """
-    db_deployment = get_deployment_by_name(db, deployment_name)
-    if db_deployment:
-        db_deployment.grafana_panel_links = links
-        db.commit()
-        db.refresh(db_deployment)
-    return db_deployment
+    result = await db.execute(
+        update(models.Deployment)
+        .where(models.Deployment.deployment_name == deployment_name)
+        .values(grafana_panel_links=links)
+    )
+    await db.commit()
+    return result.rowcount
 
-def update_deployment_status(db: Session, deployment_name: str, status: str):
-    db_deployment = get_deployment_by_name(db, deployment_name)
-    if db_deployment:
-        db_deployment.status = status
-        db.commit()
-        db.refresh(db_deployment)
-    return db_deployment
+async def update_deployment_status(db: AsyncSession, deployment_name: str, status: str, **fields):
+    """
+    Updates the status of a deployment with a single UPDATE statement. Any
+    extra column values passed in `fields` are written in the same statement.
+    Returns the number of rows updated.
+    """
+    result = await db.execute(
+        update(models.Deployment)
+        .where(models.Deployment.deployment_name == deployment_name)
+        .values(status=status, **fields)
+    )
+    await db.commit()
+    return result.rowcount
 
-def delete_deployment_by_name(db: Session, deployment_name: str):
-    db_deployment = get_deployment_by_name(db, deployment_name)
+async def delete_deployment_by_name(db: AsyncSession, deployment_name: str):
+    db_deployment = await get_deployment_by_name(db, deployment_name)
     if db_deployment:
-        db.delete(db_deployment)
-        db.commit()
+        await db.delete(db_deployment)
+        await db.commit()
     return db_deployment
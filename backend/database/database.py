@@ -1,7 +1,7 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,14 +13,49 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set.")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Plain postgres URLs are served by the psycopg (v3) driver, which uses the
+# binary protocol and server-side prepared statements, and also provides the
+# asyncio connections the engine below needs.
+for scheme in ("postgresql://", "postgres://"):
+    if DATABASE_URL.startswith(scheme):
+        DATABASE_URL = "postgresql+psycopg://" + DATABASE_URL[len(scheme):]
+        break
+# Plain SQLite URLs (local development) go through aiosqlite for the same reason.
+if DATABASE_URL.startswith("sqlite://"):
+    DATABASE_URL = "sqlite+aiosqlite://" + DATABASE_URL[len("sqlite://"):]
+
+# A larger compiled-statement cache keeps the 2.0-style select()/update()
+# constructs in crud.py from being recompiled under load.
+engine_options = {"query_cache_size": 1200}
+if DATABASE_URL.startswith("postgresql+psycopg://"):
+    engine_options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "40")),
+        # Retire connections before idle timeouts in proxies/firewalls do.
+        pool_recycle=1800,
+        # TCP keepalives detect dead connections instead of a ping per checkout.
+        pool_pre_ping=False,
+        connect_args={"prepare_threshold": 5, "keepalives": 1, "keepalives_idle": 30},
+    )
+
+# Async engine: queries await on the event loop instead of holding a
+# threadpool worker for the length of each round trip.
+engine = create_async_engine(DATABASE_URL, **engine_options)
+if engine.dialect.name == "sqlite":
+    # Local development on SQLite: WAL lets readers (the status polling)
+    # proceed during writes, and NORMAL sync is safe in WAL mode.
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+# Keep loaded attributes after commit so returned rows don't trigger a reload.
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Dependency to get a DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
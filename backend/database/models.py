@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Index
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -19,5 +19,26 @@ class Deployment(Base):
     # NEW: Field to store Grafana panel URLs as a JSON string
     grafana_panel_links = Column(Text, nullable=True)
 
+    # Remote HEAD that was last checked out for instrumentation
+    last_commit = Column(String, nullable=True)
+
+    # JSON list of kubectl resource names ("kind.group/name") applied for
+    # this deployment; undeploy deletes exactly these.
+    applied_resources = Column(Text, nullable=True)
+
+    # Error output of the last failed instrumentation run, cleared when a new
+    # run starts.
+    last_error = Column(Text, nullable=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_updated = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Covering index for the newest-first listing: on Postgres the listed
+    # columns are stored in the index, so the list is an index-only scan.
+    __table_args__ = (
+        Index(
+            "ix_deployment_created_desc",
+            created_at.desc(),
+            postgresql_include=["id", "deployment_name", "status"],
+        ),
+    )
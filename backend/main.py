@@ -1,34 +1,46 @@
 import os
+import asyncio
 import shutil
 import subprocess
 import logging
 import re
 import json
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from urllib.parse import urlparse, urlunparse, quote
 from pathlib import Path
 import httpx
+from cachetools import LRUCache, TTLCache
 import tempfile
 from typing import List
 from datetime import datetime
 
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator, ConfigDict
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 
-from git import Repo, GitCommandError
+from git import Git, Repo, GitCommandError
 from dotenv import load_dotenv
 import yaml
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from cryptography.fernet import Fernet
 
+# Prefer the libyaml-backed loader/dumper; fall back to pure Python if PyYAML
+# was built without it.
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
 # Import database components
 from database import crud, models
-from database.database import engine, get_db
+from database.database import SessionLocal, engine, get_db
 
-# Create database tables if they don't exist
-models.Base.metadata.create_all(bind=engine)
 load_dotenv()
 
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
@@ -36,7 +48,39 @@ if not ENCRYPTION_KEY:
     raise ValueError("ENCRYPTION_KEY environment variable not set.")
 fernet = Fernet(ENCRYPTION_KEY.encode())
 
-app = FastAPI(title="TraceAssist API", version="5.1.2")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The schema is managed with Alembic migrations (see migrations/), run once
+    # per rollout rather than by every worker. AUTO_CREATE_TABLES=1 is a shortcut
+    # for local development without running migrations.
+    if os.getenv("AUTO_CREATE_TABLES"):
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+    # One pooled client for GitHub API calls, so PAT checks reuse a warm
+    # connection instead of a fresh TLS handshake each time.
+    app.state.github_client = httpx.AsyncClient(
+        base_url="https://api.github.com",
+        http2=True,
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=20),
+    )
+    # Grafana gets its own pool. Nothing else is sent through this client,
+    # so its URL and token can be client defaults without reaching GitHub.
+    grafana_headers = {"Accept": "application/json"}
+    if GRAFANA_API_TOKEN:
+        grafana_headers["Authorization"] = f"Bearer {GRAFANA_API_TOKEN}"
+    app.state.grafana_client = httpx.AsyncClient(
+        base_url=GRAFANA_API_URL or "",
+        headers=grafana_headers,
+        timeout=10.0,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    )
+    yield
+    await app.state.github_client.aclose()
+    await app.state.grafana_client.aclose()
+    await engine.dispose()
+
+app = FastAPI(title="TraceAssist API", version="5.1.2", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,9 +89,73 @@ app.add_middleware(
 
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
+if not yaml.__with_libyaml__:
+    logger.warning("PyYAML was built without libyaml; manifests will be parsed by the pure-Python fallback.")
 BASE_DIR = "user-apps"
+# Older releases staged applied manifests here; undeploy still reads it for
+# deployments that have no recorded applied_resources.
 K8S_OUTPUT_DIR = "k8s-generated"
 
+# Only the tip of the default branch is ever built or scanned, so every clone
+# skips history, other branches and tags.
+SHALLOW_CLONE_OPTIONS = {"depth": 1, "single_branch": True, "no_tags": True}
+# Analyze and create only look at file names and at most one manifest, so
+# their clones skip the checkout and fetch commits and trees but no file
+# contents; the one manifest blob they read is fetched on demand.
+INSPECT_CLONE_OPTIONS = {**SHALLOW_CLONE_OPTIONS, "no_checkout": True, "filter": "blob:none"}
+
+# Cheap pre-scan for the only kinds modify_kubernetes_manifest rewrites.
+# Deliberately loose (no line anchor, optional quotes) so it can only produce
+# false positives, which just fall through to the full YAML parse.
+MANAGED_KIND_RE = re.compile(rb"""\bkind["']?\s*:\s*["']?(?:Deployment|Service)\b""")
+
+# Directories never worth scanning for language detection.
+EXCLUDED_DIRS = frozenset({'.git', 'node_modules', '__pycache__', 'venv', 'env', '.venv', 'target', 'build', 'dist'})
+LANGUAGE_DECISION_THRESHOLD = 20
+
+# Fields the OpenTelemetry operator needs on an instrumented Deployment.
+OTEL_INJECT_ANNOTATION = "instrumentation.opentelemetry.io/inject"
+OTEL_POD_SPEC = {"serviceAccountName": "traceassist-sa"}
+
+# LRU of already-transformed manifests. CI pipelines resubmit identical
+# manifests constantly and the transformation is pure, so no invalidation is
+# needed. Keys hash the content so large manifests aren't held twice.
+MANIFEST_CACHE_SIZE = 256
+MANIFEST_CACHE_MAX_BYTES = 256 * 1024
+_manifest_cache = OrderedDict()
+_manifest_cache_lock = threading.Lock()
+
+# Lines of docker build output kept for error reporting; the rest is dropped
+# as it streams past.
+BUILD_OUTPUT_TAIL_LINES = 20
+# Minimum interval between build progress writes to the deployment status.
+BUILD_PROGRESS_INTERVAL_SECONDS = 1.0
+
+# Successful GitHub token checks, keyed by a hash of the token (never the
+# token itself). Only positive answers are cached, so a token that gains
+# access is picked up immediately; revocation is noticed within the TTL.
+GITHUB_CHECK_TTL_SECONDS = 300
+# Repository hosts whose checks go through the GitHub API.
+GITHUB_HOSTS = ("github.com", "www.github.com")
+_verified_pats = TTLCache(maxsize=1024, ttl=GITHUB_CHECK_TTL_SECONDS)
+_push_permissions = TTLCache(maxsize=1024, ttl=GITHUB_CHECK_TTL_SECONDS)
+
+# Language detected by analyze for public repositories, reused by the create
+# call that normally follows it so the repository isn't cloned again.
+# Private results are not cached: create must still prove its PAT can clone.
+ANALYZE_CACHE_TTL_SECONDS = 120
+_analyzed_languages = TTLCache(maxsize=256, ttl=ANALYZE_CACHE_TTL_SECONDS)
+
+# Inspection results per (repo URL, commit). A commit's files never change,
+# so a repeat inspection only needs `git ls-remote` to find the remote HEAD;
+# that call also proves the caller's credentials can still read the repo.
+_inspections = LRUCache(maxsize=256)
+_inspections_lock = threading.Lock()
+
+# Deployments with an instrumentation run or an undeploy in progress in this
+# process. Another instrument or undeploy is refused until it finishes.
+_instrument_runs = set()
+
 # Updated Grafana Configuration
 GRAFANA_API_URL = os.getenv("GRAFANA_API_URL")
 GRAFANA_PUBLIC_URL = os.getenv("GRAFANA_PUBLIC_URL")
@@ -55,7 +163,6 @@ GRAFANA_API_TOKEN = os.getenv("GRAFANA_API_TOKEN")
 
 # Ensure directories exist at startup
 os.makedirs(BASE_DIR, exist_ok=True)
-os.makedirs(K8S_OUTPUT_DIR, exist_ok=True)
 
 # --- Pydantic Models ---
 class DeploymentBase(BaseModel):
@@ -68,11 +175,20 @@ class DeploymentBase(BaseModel):
     last_updated: Optional[datetime] = None
     push_enabled: bool = True
     grafana_panel_links: Optional[str] = None
+    last_commit: Optional[str] = None
+    last_error: Optional[str] = None
 
 class Deployment(DeploymentBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
 
+class DeploymentSummary(BaseModel):
+    id: int
+    deployment_name: str
+    status: str
+    created_at: datetime
+    model_config = ConfigDict(from_attributes=True)
+
 class AnalyzeRequest(BaseModel):
     repo_url: str
     pat_token: Optional[str] = None
@@ -87,26 +203,45 @@ class DeploymentCreate(BaseModel):
     pat_token: Optional[str] = None
     push_to_git: bool = True
 
+class MessageResponse(BaseModel):
+    message: str
+
 # --- Helper Functions ---
+def token_key(token: str) -> str:
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
 async def verify_pat(token: str) -> bool:
     if not token: return False
+    key = token_key(token)
+    if key in _verified_pats: return True
     headers = {"Authorization": f"token {token}"}
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get("https://api.github.com/user", headers=headers)
-            return response.status_code == 200
-        except httpx.RequestError:
-            return False
-
-def check_push_permissions(repo_url: str, pat_token: str) -> bool:
+    try:
+        response = await app.state.github_client.get("/user", headers=headers)
+    except httpx.RequestError:
+        return False
+    if response.status_code != 200: return False
+    _verified_pats[key] = True
+    return True
+
+def authenticated_clone_url(repo_url: str, pat_token: str) -> str:
+    """repo_url with the PAT as userinfo; unchanged when there is no PAT."""
+    if not pat_token: return repo_url
+    parsed_url = urlparse(repo_url)
+    netloc_with_token = f"{quote(pat_token, safe='')}@{parsed_url.hostname}"
+    return urlunparse((parsed_url.scheme, netloc_with_token, parsed_url.path, "", "", ""))
+
+@lru_cache(maxsize=256)
+def decrypt_pat(encrypted_pat_token: str) -> str:
+    """Stored PATs never change in place, so each ciphertext is decrypted once."""
+    return fernet.decrypt(encrypted_pat_token.encode()).decode()
+
+def dry_run_push_allowed(repo_url: str, pat_token: str) -> bool:
+    """Push check for hosts without a known API: a dry-run push from a bare-bones clone."""
     with tempfile.TemporaryDirectory() as temp_dir:
         try:
-            parsed_url = urlparse(repo_url)
-            encoded_token = quote(pat_token, safe='')
-            netloc_with_token = f"{encoded_token}@{parsed_url.hostname}"
-            clone_url = urlunparse((parsed_url.scheme, netloc_with_token, parsed_url.path, "", "", ""))
-            
-            repo = Repo.clone_from(clone_url, temp_dir, depth=1)
+            # A dry-run push needs no working tree, so skip the checkout and
+            # every blob along with it.
+            repo = Repo.clone_from(authenticated_clone_url(repo_url, pat_token), temp_dir, no_checkout=True, filter="blob:none", **SHALLOW_CLONE_OPTIONS)
             repo.git.push("--dry-run")
             return True
         except GitCommandError as e:
@@ -116,31 +251,220 @@ def check_push_permissions(repo_url: str, pat_token: str) -> bool:
             logger.error(f"An unexpected error occurred during push permission check: {e}")
             return False
 
-def detect_language(app_path: str) -> str:
-    has_package_json = False; py_count = 0; java_count = 0
-    if not os.path.isdir(app_path): return "unknown"
-    excluded_dirs = ['.git', 'node_modules', '__pycache__', 'venv', 'env', '.venv', 'target', 'build', 'dist']
-    for root, dirs, files in os.walk(app_path):
-        dirs[:] = [d for d in dirs if d not in excluded_dirs]
-        if "package.json" in files: has_package_json = True
-        for f_name in files:
-            if f_name.endswith(".py"): py_count += 1
-            if f_name.endswith(".java"): java_count += 1
-    if has_package_json: return "nodejs"
+async def check_push_permissions(repo_url: str, pat_token: str) -> bool:
+    """
+    For GitHub repositories, asks the API whether the token's user can push
+    instead of cloning to attempt a dry-run push; other hosts still get the
+    dry run.
+    """
+    parsed_url = urlparse(repo_url)
+    owner_repo = parsed_url.path.strip("/").removesuffix(".git")
+    cache_key = (token_key(pat_token), parsed_url.hostname, owner_repo)
+    if cache_key in _push_permissions: return True
+    if parsed_url.hostname not in GITHUB_HOSTS:
+        if not await asyncio.to_thread(dry_run_push_allowed, repo_url, pat_token):
+            return False
+        _push_permissions[cache_key] = True
+        return True
+    headers = {"Authorization": f"token {pat_token}"}
+    try:
+        response = await app.state.github_client.get(f"/repos/{owner_repo}", headers=headers)
+    except httpx.RequestError as e:
+        logger.error(f"Push permission check failed: {e}")
+        return False
+    if response.status_code != 200:
+        logger.error(f"Push permission check failed: GitHub returned {response.status_code} for {owner_repo}")
+        return False
+    # Classic PATs report their scopes; a user with push access still can't
+    # push through a token lacking repo/public_repo. Fine-grained tokens
+    # send no scopes header.
+    scopes = response.headers.get("X-OAuth-Scopes")
+    if scopes is not None and not {"repo", "public_repo"} & {scope.strip() for scope in scopes.split(",")}:
+        return False
+    if response.json().get("permissions", {}).get("push") is not True:
+        return False
+    _push_permissions[cache_key] = True
+    _verified_pats[cache_key[0]] = True
+    return True
+
+def list_repo_files(repo: Repo) -> list:
+    """Paths of every file at HEAD, read from the tree (no checkout needed)."""
+    return [path for path in repo.git.ls_tree("-r", "-z", "--name-only", "HEAD").split("\0") if path]
+
+def detect_language(paths: list) -> str:
+    """
+    Detects the language from the repository's file paths. Shallow paths are
+    considered first, so a package.json decides immediately, and counting
+    stops once one language has enough hits.
+    """
+    py_count = 0; java_count = 0
+    for path in sorted(paths, key=lambda p: p.count("/")):
+        *dirs, name = path.split("/")
+        if not EXCLUDED_DIRS.isdisjoint(dirs): continue
+        if name == "package.json": return "nodejs"
+        _, dot, ext = name.rpartition(".")
+        if not dot: continue
+        if ext == "py": py_count += 1
+        elif ext == "java": java_count += 1
+        if py_count >= LANGUAGE_DECISION_THRESHOLD or java_count >= LANGUAGE_DECISION_THRESHOLD: break
     if py_count > java_count: return "python"
     if java_count > 0: return "java"
     if py_count > 0: return "python"
     return "unknown"
 
-def find_first_file(directory: Path, patterns: list):
-    for pattern in patterns:
-        try: return next(directory.glob(pattern))
-        except StopIteration: continue
+def first_manifest_path(paths: list):
+    """The first *.yaml under k8s/, then deploy/, then the repository root."""
+    for prefix in ("k8s/", "deploy/", ""):
+        for path in paths:
+            if path.startswith(prefix) and path.endswith(".yaml") and "/" not in path[len(prefix):]:
+                return path
     return None
 
-def modify_kubernetes_manifest(yaml_content: str, app_id: str, image_name: str, language: str):
+def inspect_repository(repo_url: str, pat_token: str = None, fetch_manifest: bool = False) -> tuple:
+    """
+    Detects the language and, if asked, reads the manifest analyze checks.
+    Returns (language, manifest bytes or None). Only a commit not inspected
+    before is cloned, without file contents.
+    """
+    clone_url = authenticated_clone_url(repo_url, pat_token)
+    remote_head = Git().ls_remote(clone_url, "HEAD").split()
+    key = (repo_url, remote_head[0]) if remote_head else None
+    with _inspections_lock:
+        cached = _inspections.get(key)
+    if cached and (cached[2] or not fetch_manifest):
+        return cached[:2]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo = Repo.clone_from(clone_url, temp_dir, **INSPECT_CLONE_OPTIONS)
+        paths = list_repo_files(repo)
+        manifest = None
+        manifest_path = first_manifest_path(paths) if fetch_manifest else None
+        if manifest_path:
+            manifest = repo.git.show(f"HEAD:{manifest_path}", stdout_as_string=False)
+        result = (detect_language(paths), manifest)
+        if not manifest or len(manifest) <= MANIFEST_CACHE_MAX_BYTES:
+            with _inspections_lock:
+                _inspections[(repo_url, repo.head.commit.hexsha)] = (*result, fetch_manifest)
+        return result
+
+async def inspect_via_github_api(repo_url: str, pat_token: str = None, fetch_manifest: bool = False):
+    """
+    inspect_repository's answer from the GitHub API: one recursive tree
+    listing and, if asked, one raw file instead of a clone. Returns None
+    whenever the API can't answer (other hosts, no access, rate limits,
+    truncated trees) so the caller falls back to cloning.
+    """
+    parsed_url = urlparse(repo_url)
+    if parsed_url.hostname not in GITHUB_HOSTS:
+        return None
+    owner_repo = parsed_url.path.strip("/").removesuffix(".git")
+    headers = {"Authorization": f"token {pat_token}"} if pat_token else {}
     try:
-        docs = list(yaml.safe_load_all(yaml_content))
+        response = await app.state.github_client.get(f"/repos/{owner_repo}/git/trees/HEAD", params={"recursive": "1"}, headers=headers)
+        if response.status_code != 200: return None
+        listing = await asyncio.to_thread(response.json)
+        if listing.get("truncated"): return None
+        paths = [entry["path"] for entry in listing["tree"] if entry["type"] == "blob"]
+        manifest = None
+        manifest_path = first_manifest_path(paths) if fetch_manifest else None
+        if manifest_path:
+            raw_headers = {**headers, "Accept": "application/vnd.github.raw+json"}
+            response = await app.state.github_client.get(f"/repos/{owner_repo}/contents/{quote(manifest_path)}", headers=raw_headers)
+            if response.status_code != 200: return None
+            manifest = response.content
+    except (httpx.RequestError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"GitHub API inspection of {owner_repo} failed, cloning instead: {e}")
+        return None
+    return await asyncio.to_thread(detect_language, paths), manifest
+
+def otel_annotations(language: str) -> dict:
+    """Pod template annotations requesting OTel injection (treat as read-only)."""
+    annotations = {OTEL_INJECT_ANNOTATION: "true"}
+    if language and language != "unknown":
+        annotations[f"{OTEL_INJECT_ANNOTATION}-{language}"] = "true"
+    return annotations
+
+def find_first_file(directory: Path, names: list):
+    """The first of names, in priority order, that is a file in directory; one scandir."""
+    with os.scandir(directory) as entries:
+        present = {e.name for e in entries if e.is_file()}
+    return next((directory / name for name in names if name in present), None)
+
+def find_manifests(directories: list) -> list:
+    """Collects *.yaml and *.yml files from each directory in a single scandir pass."""
+    manifests = []
+    for directory in directories:
+        try:
+            with os.scandir(directory) as entries:
+                manifests.extend(Path(e.path) for e in entries if e.name.endswith((".yaml", ".yml")) and e.is_file())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return manifests
+
+def modify_kubernetes_manifest(yaml_content: bytes, app_id: str, image_name: str, language: str):
+    """
+    Manifests stay UTF-8 bytes end to end: libyaml parses and emits bytes
+    directly, so nothing is decoded to str and re-encoded on the way.
+    """
+    if not MANAGED_KIND_RE.search(yaml_content):
+        return yaml_content, False, False
+    if len(yaml_content) > MANIFEST_CACHE_MAX_BYTES:
+        return _modify_kubernetes_manifest(yaml_content, app_id, image_name, language)
+    digest = hashlib.blake2b(yaml_content, digest_size=16).digest()
+    key = (digest, app_id, image_name, language)
+    with _manifest_cache_lock:
+        cached = _manifest_cache.get(key)
+        if cached is not None:
+            _manifest_cache.move_to_end(key)
+            return cached
+    result = _modify_kubernetes_manifest(yaml_content, app_id, image_name, language)
+    with _manifest_cache_lock:
+        _manifest_cache[key] = result
+        if len(_manifest_cache) > MANIFEST_CACHE_SIZE:
+            _manifest_cache.popitem(last=False)
+    return result
+
+def _deep_merge(target: dict, overlay: dict) -> bool:
+    """
+    Merges overlay into target in place, creating missing or non-mapping
+    intermediate levels. Returns True if anything in target changed.
+    """
+    changed = False
+    for key, value in overlay.items():
+        if isinstance(value, dict):
+            current = target.get(key)
+            if not isinstance(current, dict):
+                current = target[key] = {}
+            changed |= _deep_merge(current, value)
+        elif target.get(key) != value:
+            target[key] = value
+            changed = True
+    return changed
+
+def _patch_deployment(doc: dict, app_id: str, image_name: str, language: str) -> tuple:
+    """Returns (anything changed, instrumentation added)."""
+    original_app_label = doc.get('metadata', {}).get('labels', {}).get('app')
+    app_labels = {'app': app_id}
+    changes_made = _deep_merge(doc, {
+        'metadata': {'name': f"{app_id}-deployment", 'labels': app_labels},
+        'spec': {'selector': {'matchLabels': app_labels}, 'template': {'metadata': {'labels': app_labels}}},
+    })
+    template = doc['spec']['template']
+    containers = template.setdefault('spec', {}).setdefault('containers', [])
+    if containers:
+        container_to_modify = next((c for c in containers if c.get('name') == original_app_label), containers[0])
+        changes_made |= _deep_merge(container_to_modify, {'image': image_name, 'imagePullPolicy': 'Never'})
+    instr_changes = _deep_merge(template, {'metadata': {'annotations': otel_annotations(language)}, 'spec': OTEL_POD_SPEC})
+    return changes_made or instr_changes, instr_changes
+
+def _patch_service(doc: dict, app_id: str, image_name: str, language: str) -> tuple:
+    return _deep_merge(doc, {'spec': {'selector': {'app': app_id}}}), False
+
+# Per-kind rewrites; kinds not listed here pass through untouched.
+MANIFEST_PATCHERS = {"Deployment": _patch_deployment, "Service": _patch_service}
+
+def _modify_kubernetes_manifest(yaml_content: bytes, app_id: str, image_name: str, language: str):
+    try:
+        docs = list(yaml.load_all(yaml_content, Loader=SafeLoader))
         modified_docs = []
         any_changes_made = False
         instrumentation_changes_made = False
@@ -148,111 +472,78 @@ def modify_kubernetes_manifest(yaml_content: str, app_id: str, image_name: str,
             if not isinstance(doc, dict):
                 modified_docs.append(doc)
                 continue
-            kind = doc.get("kind")
-            original_app_label = doc.get('metadata', {}).get('labels', {}).get('app')
-            if kind == "Deployment":
-                if doc['metadata'].get('name') != f"{app_id}-deployment":
-                    doc['metadata']['name'] = f"{app_id}-deployment"
-                    any_changes_made = True
-                labels = doc['metadata'].setdefault('labels', {})
-                if labels.get('app') != app_id:
-                    labels['app'] = app_id
-                    any_changes_made = True
-                spec = doc.setdefault('spec', {})
-                if spec.setdefault('selector', {}).setdefault('matchLabels', {}).get('app') != app_id:
-                    spec['selector']['matchLabels']['app'] = app_id
-                    any_changes_made = True
-                template = spec.setdefault('template', {})
-                if template.setdefault('metadata', {}).setdefault('labels', {}).get('app') != app_id:
-                    template['metadata']['labels']['app'] = app_id
-                    any_changes_made = True
-                pod_spec = template.setdefault('spec', {})
-                containers = pod_spec.setdefault('containers', [])
-                if containers:
-                    container_to_modify = next((c for c in containers if c.get('name') == original_app_label), containers[0])
-                    if container_to_modify.get('image') != image_name:
-                        container_to_modify['image'] = image_name
-                        any_changes_made = True
-                    if container_to_modify.get('imagePullPolicy') != 'Never':
-                        container_to_modify['imagePullPolicy'] = 'Never'
-                        any_changes_made = True
-                annotations = template.setdefault('metadata', {}).setdefault('annotations', {})
-                if annotations.get("instrumentation.opentelemetry.io/inject") != "true":
-                    annotations["instrumentation.opentelemetry.io/inject"] = "true"
-                    any_changes_made = True
-                    instrumentation_changes_made = True
-                if language != "unknown" and annotations.get(f"instrumentation.opentelemetry.io/inject-{language}") != "true":
-                     annotations[f"instrumentation.opentelemetry.io/inject-{language}"] = "true"
-                     any_changes_made = True
-                     instrumentation_changes_made = True
-                if pod_spec.get('serviceAccountName') != 'traceassist-sa':
-                    pod_spec['serviceAccountName'] = 'traceassist-sa'
-                    any_changes_made = True
-                    instrumentation_changes_made = True
-            elif kind == "Service":
-                spec = doc.setdefault('spec', {})
-                if spec.setdefault('selector', {}).get('app') != app_id:
-                    spec['selector']['app'] = app_id
-                    any_changes_made = True
+            patch = MANIFEST_PATCHERS.get(doc.get("kind"))
+            if patch:
+                changes_made, instr_changes = patch(doc, app_id, image_name, language)
+                any_changes_made |= changes_made
+                instrumentation_changes_made |= instr_changes
             modified_docs.append(doc)
-        return yaml.dump_all(modified_docs, sort_keys=False), any_changes_made, instrumentation_changes_made
+        if not any_changes_made:
+            # Already instrumented (the usual redeploy): skip the dump and
+            # hand back the original bytes, formatting and comments intact.
+            return yaml_content, False, False
+        return yaml.dump_all(modified_docs, Dumper=SafeDumper, sort_keys=False, encoding="utf-8"), any_changes_made, instrumentation_changes_made
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to modify Kubernetes manifest: {e}")
 
+def manifest_needs_instrumentation(yaml_content: bytes, language: str) -> bool:
+    """
+    True if modify_kubernetes_manifest would add OTel instrumentation to any
+    Deployment. Analyze only needs this answer, so nothing is rewritten or
+    dumped back to YAML.
+    """
+    if not MANAGED_KIND_RE.search(yaml_content):
+        return False
+    wanted_annotations = otel_annotations(language).items()
+    for doc in yaml.load_all(yaml_content, Loader=SafeLoader):
+        if not isinstance(doc, dict) or doc.get("kind") != "Deployment":
+            continue
+        template = (doc.get('spec') or {}).get('template') or {}
+        annotations = (template.get('metadata') or {}).get('annotations') or {}
+        pod_spec = template.get('spec') or {}
+        if not (annotations.items() >= wanted_annotations and pod_spec.items() >= OTEL_POD_SPEC.items()):
+            return True
+    return False
+
 # --- Grafana Helper Function ---
+# Dashboard panels are the same for every deployment except for the pod
+# selector in each query, so everything else is built once at import.
+# The shared nested dicts are only serialized, never mutated.
+GRAFANA_PANEL_DEFINITIONS = [
+    (1, "CPU Usage (Cores)", 'sum(rate(container_cpu_usage_seconds_total{{pod=~"{pod_name_pattern}"}}[5m])) by (pod)', "short"),
+    (2, "Memory Usage (MB)", 'sum(container_memory_working_set_bytes{{pod=~"{pod_name_pattern}"}}) by (pod)', "bytes"),
+    (3, "Network Traffic Received (Bytes/sec)", 'sum(rate(container_network_receive_bytes_total{{pod=~"{pod_name_pattern}"}}[5m])) by (pod)', "bps"),
+    (4, "Network Traffic Transmitted (Bytes/sec)", 'sum(rate(container_network_transmit_bytes_total{{pod=~"{pod_name_pattern}"}}[5m])) by (pod)', "bps"),
+]
+GRAFANA_PANEL_EXPRS = [expr for _, _, expr, _ in GRAFANA_PANEL_DEFINITIONS]
+GRAFANA_PANEL_SKELETONS = [
+    {
+        "id": panel_id,
+        "title": title,
+        "type": "timeseries",
+        "datasource": {"type": "prometheus", "uid": "prometheus"},
+        "gridPos": {"h": 8, "w": 12, "x": 0 if i % 2 == 0 else 12, "y": (i // 2) * 8},
+        "fieldConfig": {
+            "defaults": {
+                "color": {"mode": "palette-classic"},
+                "custom": {"lineWidth": 2, "fillOpacity": 10},
+                "unit": unit
+            }
+        }
+    }
+    for i, (panel_id, title, _, unit) in enumerate(GRAFANA_PANEL_DEFINITIONS)
+]
+
 async def generate_and_upload_grafana_dashboard(deployment_name: str) -> list:
     dashboard_title = f"{deployment_name} Metrics"
     dashboard_uid = f"traceassist-{deployment_name}"
-    
     # Using a regex to match pod names starting with the deployment name
     pod_name_pattern = f"{deployment_name}-deployment-.*"
-
-    panel_definitions = [
-        {
-            "id": 1, 
-            "title": "CPU Usage (Cores)", 
-            "expr": 'sum(rate(container_cpu_usage_seconds_total{pod=~"' + pod_name_pattern + '"}[5m])) by (pod)',
-            "format": "short"
-        },
-        {
-            "id": 2, 
-            "title": "Memory Usage (MB)", 
-            "expr": 'sum(container_memory_working_set_bytes{pod=~"' + pod_name_pattern + '"}) by (pod)',
-            "format": "bytes"
-        },
-        {
-            "id": 3, 
-            "title": "Network Traffic Received (Bytes/sec)", 
-            "expr": 'sum(rate(container_network_receive_bytes_total{pod=~"' + pod_name_pattern + '"}[5m])) by (pod)',
-            "format": "bps"
-        },
-        {
-            "id": 4, 
-            "title": "Network Traffic Transmitted (Bytes/sec)", 
-            "expr": 'sum(rate(container_network_transmit_bytes_total{pod=~"' + pod_name_pattern + '"}[5m])) by (pod)',
-            "format": "bps"
-        },
+    panels = [
+        {**skeleton, "targets": [{"expr": expr.format(pod_name_pattern=pod_name_pattern), "legendFormat": "{{pod}}"}]}
+        for skeleton, expr in zip(GRAFANA_PANEL_SKELETONS, GRAFANA_PANEL_EXPRS)
     ]
 
-    panels = []
-    for i, p_def in enumerate(panel_definitions):
-        panel = {
-            "id": p_def["id"],
-            "title": p_def["title"],
-            "type": "timeseries",
-            "datasource": {"type": "prometheus", "uid": "prometheus"},
-            "targets": [{"expr": p_def["expr"], "legendFormat": "{{pod}}"}],
-            "gridPos": {"h": 8, "w": 12, "x": 0 if i % 2 == 0 else 12, "y": (i // 2) * 8},
-            "fieldConfig": {
-                "defaults": {
-                    "color": {"mode": "palette-classic"},
-                    "custom": {"lineWidth": 2, "fillOpacity": 10},
-                    "unit": p_def["format"]
-                }
-            }
-        }
-        panels.append(panel)
-
     dashboard_json = {
         "dashboard": {
             "id": None,
@@ -268,37 +559,30 @@ async def generate_and_upload_grafana_dashboard(deployment_name: str) -> list:
         "overwrite": True
     }
 
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {GRAFANA_API_TOKEN}"
-    }
-
     try:
         logger.info(f"Attempting to create Grafana dashboard for '{deployment_name}'...")
         logger.info(f"Connecting to Grafana API at: {GRAFANA_API_URL}")
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"{GRAFANA_API_URL}/api/dashboards/db", json=dashboard_json, headers=headers)
-            
-            logger.info(f"Grafana API response status: {response.status_code}")
-            logger.debug(f"Grafana API response body: {response.text}")
-            
-            response.raise_for_status()
-            data = response.json()
-            
-            dashboard_slug = data.get("url", "").split('/')[-1]
-            if not dashboard_slug:
-                logger.warning("'url' key not found in Grafana API response, cannot generate links.")
-                return []
-
-            panel_links = []
-            for p_def in panel_definitions:
-                # --- CHANGE: Added &theme=light to the end of the URL ---
-                link = f"{GRAFANA_PUBLIC_URL}/d-solo/{dashboard_uid}/{dashboard_slug}?orgId=1&refresh=10s&panelId={p_def['id']}&theme=light"
-                panel_links.append(link)
-            
-            logger.info(f"Successfully generated {len(panel_links)} panel links.")
-            return panel_links
+        response = await app.state.grafana_client.post("/api/dashboards/db", json=dashboard_json)
+        
+        logger.info(f"Grafana API response status: {response.status_code}")
+        logger.debug(f"Grafana API response body: {response.text}")
+        
+        response.raise_for_status()
+        data = response.json()
+        
+        dashboard_slug = data.get("url", "").split('/')[-1]
+        if not dashboard_slug:
+            logger.warning("'url' key not found in Grafana API response, cannot generate links.")
+            return []
+
+        panel_links = []
+        for p_def in GRAFANA_PANEL_SKELETONS:
+            # --- CHANGE: Added &theme=light to the end of the URL ---
+            link = f"{GRAFANA_PUBLIC_URL}/d-solo/{dashboard_uid}/{dashboard_slug}?orgId=1&refresh=10s&panelId={p_def['id']}&theme=light"
+            panel_links.append(link)
+        
+        logger.info(f"Successfully generated {len(panel_links)} panel links.")
+        return panel_links
             
     except httpx.RequestError as e:
         logger.error(f"Failed to connect to Grafana at {GRAFANA_API_URL}. Check network connectivity from the backend pod. Error: {e}")
@@ -310,41 +594,158 @@ async def generate_and_upload_grafana_dashboard(deployment_name: str) -> list:
         logger.error(f"An unexpected error occurred during Grafana dashboard generation: {e}")
         return []
     
+# --- Endpoint Step Helpers ---
+
+def render_manifests(manifest_paths: list, deployment_name: str, image_name: str, language: str) -> tuple:
+    """
+    Instruments the manifests in memory. Returns ({path: new content} for the
+    files that changed, True if instrumentation had to be added).
+    """
+    rendered = {}
+    instrumentation_changes_needed = False
+    for manifest_path in manifest_paths:
+        original_content = manifest_path.read_bytes()
+        modified_content, any_changes_made, instr_changes = modify_kubernetes_manifest(original_content, deployment_name, image_name, language)
+        if any_changes_made:
+            rendered[manifest_path] = modified_content
+        if instr_changes:
+            instrumentation_changes_needed = True
+    return rendered, instrumentation_changes_needed
+
+def write_manifests(rendered: dict):
+    for manifest_path, content in rendered.items():
+        manifest_path.write_bytes(content)
+
+def checkout_repository(clone_url: str, app_dir: Path) -> tuple:
+    """
+    Brings app_dir to the remote HEAD and returns (repo, commit_sha). A
+    checkout already at that commit is only reset, an older one is fetched
+    in place, and only a missing or broken one is cloned from scratch.
+    """
+    remote_sha = Git().ls_remote(clone_url, "HEAD").split()[0]
+    if (app_dir / ".git").is_dir():
+        try:
+            repo = Repo(app_dir)
+            if repo.head.commit.hexsha != remote_sha:
+                repo.git.fetch(clone_url, "HEAD", depth=1, no_tags=True)
+                repo.git.reset("FETCH_HEAD", hard=True)
+            else:
+                # Undo manifests rewritten by a previous run that wasn't pushed.
+                repo.git.reset(hard=True)
+            repo.git.clean("-fdx")
+            return repo, remote_sha
+        except (GitCommandError, ValueError) as e:
+            logger.warning(f"Reusing checkout in {app_dir} failed, cloning again: {e}")
+    if app_dir.exists(): shutil.rmtree(app_dir)
+    repo = Repo.clone_from(clone_url, str(app_dir), **SHALLOW_CLONE_OPTIONS)
+    return repo, repo.head.commit.hexsha
+
+async def run_build(args: list, cwd: str, env: dict = None, on_progress=None):
+    """
+    Runs a command with unbounded output (docker build) as an asyncio
+    subprocess, holding only its last BUILD_OUTPUT_TAIL_LINES lines. The
+    latest line is passed to the on_progress coroutine at most once per
+    BUILD_PROGRESS_INTERVAL_SECONDS. Raises CalledProcessError with the tail
+    as stderr on failure. If reading stops early for any reason (cancellation,
+    an overlong line, a failing on_progress) the process is killed.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args, cwd=cwd, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, limit=1024 * 1024
+    )
+    tail = deque(maxlen=BUILD_OUTPUT_TAIL_LINES)
+    loop = asyncio.get_running_loop()
+    last_progress = 0.0
+    try:
+        async for raw_line in proc.stdout:
+            line = raw_line.decode(errors="replace")
+            tail.append(line)
+            logger.debug(line.rstrip())
+            if on_progress and line.strip() and loop.time() - last_progress >= BUILD_PROGRESS_INTERVAL_SECONDS:
+                last_progress = loop.time()
+                await on_progress(line.strip())
+        returncode = await proc.wait()
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, args, stderr="".join(tail))
+
+def failure_detail(e: Exception) -> str:
+    """
+    Text describing a failed step: captured stderr (decoded if bytes), an
+    HTTPException's detail, or the exception itself when neither is set
+    (e.g. a TimeoutExpired without output).
+    """
+    detail = getattr(e, 'stderr', None) or getattr(e, 'detail', None)
+    if isinstance(detail, bytes):
+        detail = detail.decode(errors="replace")
+    return str(detail) if detail else str(e) or type(e).__name__
+
+def push_instrumentation_commit(repo: Repo):
+    repo.git.add(all=True)
+    repo.index.commit("feat: Add OpenTelemetry instrumentation by TraceAssist")
+    repo.remotes.origin.push()
+
+def apply_manifests(manifest_paths: list, rendered: dict) -> list:
+    """
+    Applies every manifest with a single `kubectl apply -f -`, streaming the
+    rendered content (or the original, if unchanged) over stdin. Returns the
+    applied resources as kubectl names, e.g. "deployment.apps/x".
+    """
+    stream = b"\n---\n".join(rendered.get(p) or p.read_bytes() for p in manifest_paths)
+    apply_args = ["kubectl", "apply", "-n", "traceassist", "-o", "name", "-f", "-"]
+    result = subprocess.run(apply_args, input=stream, capture_output=True, timeout=60)
+    if result.returncode:
+        raise subprocess.CalledProcessError(result.returncode, apply_args, stderr=result.stderr.decode(errors="replace"))
+    return result.stdout.decode().split()
+
+def delete_manifest_resources(manifest_files: list):
+    """
+    Deletes every manifest's resources with one kubectl call, then the files.
+    A failed delete is re-raised with the files left in place.
+    """
+    delete_args = ["kubectl", "delete", "-n", "traceassist", "--ignore-not-found"]
+    for file_path in manifest_files:
+        delete_args += ["-f", str(file_path)]
+    try:
+        subprocess.run(delete_args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=60)
+    except Exception as e:
+        logger.error(f"Failed to delete resources for {len(manifest_files)} manifest(s): {failure_detail(e)}")
+        raise
+    for file_path in manifest_files:
+        os.remove(file_path)
+    logger.info(f"Deleted {len(manifest_files)} manifest(s) and their Kubernetes resources")
+
 # --- API Endpoints ---
 @app.post("/deployments/analyze", response_model=AnalyzeResponse)
 async def analyze_repository(request: AnalyzeRequest):
     is_public = False
     push_required = False
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            Repo.clone_from(request.repo_url, temp_dir, depth=1)
-            is_public = True
-            language = detect_language(temp_dir)
-            manifest_path = find_first_file(Path(temp_dir), ["k8s/*.yaml", "deploy/*.yaml", "*.yaml"])
-            if manifest_path:
-                _, _, instrumentation_changes_needed = modify_kubernetes_manifest(manifest_path.read_text(), "temp-check", "temp-check", language)
-                if instrumentation_changes_needed:
-                    push_required = True
-            return AnalyzeResponse(is_public=is_public, push_required=push_required)
+        language, manifest = (
+            await inspect_via_github_api(request.repo_url, fetch_manifest=True)
+            or await asyncio.to_thread(inspect_repository, request.repo_url, fetch_manifest=True)
+        )
+        is_public = True
+        _analyzed_languages[request.repo_url] = language
+        if manifest and await asyncio.to_thread(manifest_needs_instrumentation, manifest, language):
+            push_required = True
+        return AnalyzeResponse(is_public=is_public, push_required=push_required)
     except GitCommandError:
         if not request.pat_token:
             raise HTTPException(status_code=400, detail="This is a private repository. A PAT token is required for analysis.")
         if not await verify_pat(request.pat_token):
             raise HTTPException(status_code=400, detail="The provided GitHub PAT is invalid or expired.")
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                parsed_url = urlparse(request.repo_url)
-                netloc_with_token = f"{quote(request.pat_token, safe='')}@{parsed_url.hostname}"
-                clone_url = urlunparse((parsed_url.scheme, netloc_with_token, parsed_url.path, "", "", ""))
-                Repo.clone_from(clone_url, temp_dir, depth=1)
-                is_public = False
-                language = detect_language(temp_dir)
-                manifest_path = find_first_file(Path(temp_dir), ["k8s/*.yaml", "deploy/*.yaml", "*.yaml"])
-                if manifest_path:
-                    _, _, instrumentation_changes_needed = modify_kubernetes_manifest(manifest_path.read_text(), "temp-check", "temp-check", language)
-                    if instrumentation_changes_needed:
-                        push_required = True
-                return AnalyzeResponse(is_public=is_public, push_required=push_required)
+            language, manifest = (
+                await inspect_via_github_api(request.repo_url, request.pat_token, fetch_manifest=True)
+                or await asyncio.to_thread(inspect_repository, request.repo_url, request.pat_token, fetch_manifest=True)
+            )
+            is_public = False
+            if manifest and await asyncio.to_thread(manifest_needs_instrumentation, manifest, language):
+                push_required = True
+            return AnalyzeResponse(is_public=is_public, push_required=push_required)
         except GitCommandError as e:
             logger.error(f"Failed to clone private repo even with PAT: {e.stderr}")
             raise HTTPException(status_code=400, detail="Failed to clone repository with the provided PAT. Check URL and token permissions.")
@@ -353,28 +754,28 @@ async def analyze_repository(request: AnalyzeRequest):
         raise HTTPException(status_code=500, detail=f"Failed to analyze repository: {e}")
 
 @app.post("/deployments", status_code=status.HTTP_201_CREATED, response_model=Deployment)
-async def create_deployment_final(deployment: DeploymentCreate, db: Session = Depends(get_db)):
-    if crud.get_deployment_by_name(db, deployment_name=deployment.deployment_name):
+async def create_deployment_final(deployment: DeploymentCreate, db: AsyncSession = Depends(get_db)):
+    if await crud.deployment_exists(db, deployment_name=deployment.deployment_name):
         raise HTTPException(status_code=409, detail="A deployment with this name already exists.")
     if deployment.pat_token:
-        if not await verify_pat(deployment.pat_token):
+        # The repository lookup behind the push check also proves the token
+        # is valid, so /user is only asked when the token is unusable here.
+        push_checked = deployment.push_to_git and await check_push_permissions(deployment.repo_url, deployment.pat_token)
+        if not push_checked and not await verify_pat(deployment.pat_token):
             raise HTTPException(status_code=400, detail="The provided GitHub PAT is invalid or expired.")
-        if deployment.push_to_git and not check_push_permissions(deployment.repo_url, deployment.pat_token):
+        if deployment.push_to_git and not push_checked:
              raise HTTPException(status_code=403, detail="The provided PAT token does not have push permissions for this repository.")
-    language = "unknown"
-    try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            clone_url = deployment.repo_url
-            if deployment.pat_token:
-                parsed_url = urlparse(clone_url)
-                netloc_with_token = f"{quote(deployment.pat_token, safe='')}@{parsed_url.hostname}"
-                clone_url = urlunparse((parsed_url.scheme, netloc_with_token, parsed_url.path, "", "", ""))
-            Repo.clone_from(clone_url, temp_dir, depth=1)
-            language = detect_language(temp_dir)
-    except GitCommandError:
-        raise HTTPException(status_code=400, detail="Failed to clone repository. If it's private, a valid PAT token is required.")
+    language = _analyzed_languages.get(deployment.repo_url)
+    if language is None:
+        try:
+            language, _ = (
+                await inspect_via_github_api(deployment.repo_url, deployment.pat_token)
+                or await asyncio.to_thread(inspect_repository, deployment.repo_url, deployment.pat_token)
+            )
+        except GitCommandError:
+            raise HTTPException(status_code=400, detail="Failed to clone repository. If it's private, a valid PAT token is required.")
     encrypted_token_str = fernet.encrypt(deployment.pat_token.encode()).decode() if deployment.pat_token else None
-    db_deployment = crud.create_deployment(
+    db_deployment = await crud.create_deployment(
         db=db,
         deployment_name=deployment.deployment_name,
         repo_url=deployment.repo_url,
@@ -385,110 +786,157 @@ async def create_deployment_final(deployment: DeploymentCreate, db: Session = De
     )
     return db_deployment
 
-@app.get("/deployments", response_model=List[Deployment])
-def get_all_deployments(db: Session = Depends(get_db)):
-    return crud.get_deployments(db)
+@app.get("/deployments", response_model=List[DeploymentSummary])
+async def get_all_deployments(db: AsyncSession = Depends(get_db)):
+    return await crud.get_deployments(db)
 
 @app.get("/deployments/{deployment_name}", response_model=Deployment)
-def get_deployment_details(deployment_name: str, db: Session = Depends(get_db)):
-    db_deployment = crud.get_deployment_by_name(db, deployment_name=deployment_name)
+async def get_deployment_details(deployment_name: str, db: AsyncSession = Depends(get_db)):
+    db_deployment = await crud.get_deployment_by_name(db, deployment_name=deployment_name)
     if not db_deployment:
         raise HTTPException(status_code=404, detail="Deployment not found.")
     return db_deployment
 
-@app.delete("/deployments/{deployment_name}")
-async def undeploy_application(deployment_name: str, db: Session = Depends(get_db)):
-    db_deployment = crud.get_deployment_by_name(db, deployment_name=deployment_name)
+@app.delete("/deployments/{deployment_name}", response_model=MessageResponse)
+async def undeploy_application(deployment_name: str, db: AsyncSession = Depends(get_db)):
+    db_deployment = await crud.get_deployment_by_name(db, deployment_name=deployment_name)
     if not db_deployment:
         raise HTTPException(status_code=404, detail="Deployment not found.")
+    if deployment_name in _instrument_runs:
+        raise HTTPException(status_code=409, detail="This deployment is being instrumented or undeployed; retry once it finishes.")
+    _instrument_runs.add(deployment_name)
     try:
-        crud.update_deployment_status(db, deployment_name=deployment_name, status="Undeploying")
-        manifest_dir = Path(K8S_OUTPUT_DIR)
-        manifest_files = list(manifest_dir.glob(f"{deployment_name}-*.yaml"))
-        if not manifest_files:
-            logger.warning(f"No manifest files found for '{deployment_name}' to delete.")
+        await crud.update_deployment_status(db, deployment_name, "Undeploying", last_error=None)
+        if db_deployment.applied_resources:
+            delete_args = ["kubectl", "delete", "-n", "traceassist", "--ignore-not-found", *json.loads(db_deployment.applied_resources)]
+            await asyncio.to_thread(subprocess.run, delete_args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=60)
         else:
-            for file_path in manifest_files:
-                try:
-                    subprocess.run(["kubectl", "delete", "-f", str(file_path), "--ignore-not-found"], check=True, capture_output=True, text=True)
-                    os.remove(file_path)
-                    logger.info(f"Deleted manifest and Kubernetes resource for {file_path}")
-                except Exception as e:
-                    logger.error(f"Failed to delete resource for {file_path}: {e}")
+            manifest_dir = Path(K8S_OUTPUT_DIR)
+            manifest_files = [p for p in manifest_dir.glob(f"{deployment_name}-*") if p.suffix in (".yaml", ".yml")]
+            if not manifest_files:
+                logger.warning(f"No applied resources or manifest files found for '{deployment_name}' to delete.")
+            else:
+                await asyncio.to_thread(delete_manifest_resources, manifest_files)
         app_dir = Path(BASE_DIR) / deployment_name
         if app_dir.exists():
-            shutil.rmtree(app_dir)
-        crud.delete_deployment_by_name(db, deployment_name=deployment_name)
-        return {"message": f"Successfully undeployed and deleted record for '{deployment_name}'."}
+            await asyncio.to_thread(shutil.rmtree, app_dir)
+        await crud.delete_deployment_by_name(db, deployment_name=deployment_name)
+        return MessageResponse(message=f"Successfully undeployed and deleted record for '{deployment_name}'.")
     except Exception as e:
-        crud.update_deployment_status(db, deployment_name=deployment_name, status="Undeploy Failed")
-        detail = e.stderr if hasattr(e, 'stderr') else str(e)
+        detail = failure_detail(e)
+        await crud.update_deployment_status(db, deployment_name, "Undeploy Failed", last_error=detail[-1000:])
         raise HTTPException(status_code=500, detail=f"An error occurred during undeployment: {detail}")
+    finally:
+        _instrument_runs.discard(deployment_name)
 
-@app.post("/deployments/{deployment_name}/instrument")
-async def instrument_and_deploy(deployment_name: str, db: Session = Depends(get_db)):
-    db_deployment = crud.get_deployment_by_name(db, deployment_name)
-    if not db_deployment:
+@app.post("/deployments/{deployment_name}/instrument", status_code=status.HTTP_202_ACCEPTED, response_model=MessageResponse)
+async def instrument_and_deploy(deployment_name: str, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    if not await crud.deployment_exists(db, deployment_name):
         raise HTTPException(status_code=404, detail="Deployment not found.")
+    if deployment_name in _instrument_runs:
+        raise HTTPException(status_code=409, detail="This deployment is already being instrumented or undeployed.")
+    _instrument_runs.add(deployment_name)
+    try:
+        await crud.update_deployment_status(db, deployment_name, "Cloning repository...", last_error=None)
+    except BaseException:
+        _instrument_runs.discard(deployment_name)
+        raise
+    # Clone, build and rollout take minutes; clients follow progress through
+    # GET /deployments/{name} instead of holding this request open.
+    background_tasks.add_task(run_instrumentation, deployment_name)
+    return MessageResponse(message="Instrumentation started.")
+
+async def run_instrumentation(deployment_name: str):
+    """
+    Background half of instrument. The request's session is closed by the
+    time this runs, so it opens its own.
+    """
+    try:
+        async with SessionLocal() as db:
+            db_deployment = await crud.get_deployment_by_name(db, deployment_name)
+            if db_deployment:
+                await instrument_deployment(db, db_deployment)
+    finally:
+        _instrument_runs.discard(deployment_name)
+
+async def instrument_deployment(db: AsyncSession, db_deployment: models.Deployment):
+    deployment_name = db_deployment.deployment_name
     app_dir = Path(BASE_DIR) / deployment_name
     try:
-        crud.update_deployment_status(db, deployment_name=deployment_name, status="Cloning repository...")
         pat_token = None
         if db_deployment.encrypted_pat_token:
-            pat_token = fernet.decrypt(db_deployment.encrypted_pat_token.encode()).decode()
-        effective_clone_url = db_deployment.repo_url
-        if pat_token:
-            parsed_url = urlparse(db_deployment.repo_url)
-            netloc_with_token = f"{quote(pat_token, safe='')}@{parsed_url.hostname}"
-            effective_clone_url = urlunparse((parsed_url.scheme, netloc_with_token, parsed_url.path, "", "", ""))
-        if app_dir.exists(): shutil.rmtree(app_dir)
-        repo = Repo.clone_from(effective_clone_url, str(app_dir))
-        crud.update_deployment_status(db, deployment_name=deployment_name, status="Building Docker image...")
+            pat_token = decrypt_pat(db_deployment.encrypted_pat_token)
+        effective_clone_url = authenticated_clone_url(db_deployment.repo_url, pat_token)
+        repo, commit_sha = await asyncio.to_thread(checkout_repository, effective_clone_url, app_dir)
+        # The language detected at creation time is reused; only a missing or
+        # inconclusive result is re-detected. It is stored, along with the
+        # checked-out commit, with the next status transition.
         language = db_deployment.language
-        dockerfile_path = find_first_file(app_dir, ["Dockerfile", "dockerfile"])
+        checkout_fields = {"last_commit": commit_sha}
+        if not language or language == "unknown":
+            repo_files = await asyncio.to_thread(list_repo_files, repo)
+            language = await asyncio.to_thread(detect_language, repo_files)
+            checkout_fields["language"] = language
+        dockerfile_path = await asyncio.to_thread(find_first_file, app_dir, ["Dockerfile", "dockerfile"])
         if not dockerfile_path:
             raise HTTPException(status_code=404, detail="Dockerfile not found in repository.")
-        image_name = f"user-app-{deployment_name.lower()}:latest"
-        subprocess.run(["docker", "build", "-t", image_name, "."], cwd=str(app_dir), check=True, capture_output=True, text=True)
-        crud.update_deployment_status(db, deployment_name=deployment_name, status="Analyzing Kubernetes manifests...")
         search_dirs = [app_dir, app_dir / "k8s", app_dir / "deploy", app_dir / "manifests"]
-        found_manifest_paths = [p for d in search_dirs if d.is_dir() for p in d.glob("*.yaml")] + [p for d in search_dirs if d.is_dir() for p in d.glob("*.yml")]
+        found_manifest_paths = await asyncio.to_thread(find_manifests, search_dirs)
         if not found_manifest_paths:
             raise HTTPException(status_code=404, detail="No Kubernetes YAML manifests found.")
-        instrumentation_changes_needed = False
-        for manifest_path in found_manifest_paths:
-            original_content = manifest_path.read_text()
-            modified_content, any_changes_made, instr_changes = modify_kubernetes_manifest(original_content, deployment_name, image_name, language)
-            if any_changes_made:
-                manifest_path.write_text(modified_content)
-            if instr_changes:
-                instrumentation_changes_needed = True
+        await crud.update_deployment_status(db, deployment_name, "Building Docker image and instrumenting manifests...", **checkout_fields)
+        image_name = f"user-app-{deployment_name.lower()}:latest"
+        # BuildKit with inline cache metadata lets a rebuild reuse unchanged
+        # layers of the previous image under the same tag.
+        build_args = ["docker", "build", "--build-arg", "BUILDKIT_INLINE_CACHE=1", "--cache-from", image_name, "-t", image_name, "."]
+        async def report_build_progress(line: str):
+            await crud.update_deployment_status(db, deployment_name, f"Building Docker image: {line[:80]}")
+        build = asyncio.create_task(
+            run_build(build_args, cwd=str(app_dir), env={**os.environ, "DOCKER_BUILDKIT": "1"}, on_progress=report_build_progress)
+        )
+        # Rendering only needs the image name, so it runs alongside the build.
+        # The results stay in memory and are only written to the checkout
+        # when pushed, keeping the build context identical to the checkout
+        # (and the layer cache stable).
+        try:
+            rendered_manifests, instrumentation_changes_needed = await asyncio.to_thread(
+                render_manifests, found_manifest_paths, deployment_name, image_name, language
+            )
+        except BaseException:
+            # Stop the build so its progress updates can't overwrite "Failed",
+            # and wait for it: a progress write in flight uses the same session
+            # as the "Failed" write that follows.
+            build.cancel()
+            await asyncio.gather(build, return_exceptions=True)
+            raise
+        await build
         if instrumentation_changes_needed and pat_token and db_deployment.push_enabled:
-            crud.update_deployment_status(db, deployment_name=deployment_name, status="Pushing manifest changes to Git...")
-            repo.git.add(all=True)
-            repo.index.commit("feat: Add OpenTelemetry instrumentation by TraceAssist")
-            repo.remotes.origin.push()
+            await crud.update_deployment_status(db, deployment_name, "Pushing manifest changes to Git...")
+            await asyncio.to_thread(write_manifests, rendered_manifests)
+            await asyncio.to_thread(push_instrumentation_commit, repo)
         elif not instrumentation_changes_needed:
-            crud.update_deployment_status(db, deployment_name=deployment_name, status="Manifests already instrumented.")
+            await crud.update_deployment_status(db, deployment_name, "Manifests already instrumented.")
         else:
-            crud.update_deployment_status(db, deployment_name=deployment_name, status="Proceeding without pushing changes to Git.")
-        crud.update_deployment_status(db, deployment_name=deployment_name, status="Deploying to Kubernetes...")
-        for manifest_path in found_manifest_paths:
-            output_path = Path(K8S_OUTPUT_DIR) / f"{deployment_name}-{manifest_path.name}"
-            output_path.write_text(manifest_path.read_text())
-            subprocess.run(["kubectl", "apply", "-n", "traceassist", "-f", str(output_path)], check=True, capture_output=True, text=True, timeout=60)
-        
-        crud.update_deployment_status(db, deployment_name=deployment_name, status="Generating Grafana dashboard...")
+            await crud.update_deployment_status(db, deployment_name, "Proceeding without pushing changes to Git.")
+        await crud.update_deployment_status(db, deployment_name, "Deploying to Kubernetes...")
+        applied = await asyncio.to_thread(apply_manifests, found_manifest_paths, rendered_manifests)
+        # Resources from earlier runs are kept, so undeploy also removes any
+        # the repository has dropped since.
+        previous = json.loads(db_deployment.applied_resources) if db_deployment.applied_resources else []
+        applied_resources = json.dumps(list(dict.fromkeys(previous + applied)))
+        await crud.update_deployment_status(db, deployment_name, "Generating Grafana dashboard...", applied_resources=applied_resources)
         panel_links = await generate_and_upload_grafana_dashboard(deployment_name)
+        final_fields = {}
         if panel_links:
-            crud.update_deployment_grafana_links(db, deployment_name, json.dumps(panel_links))
+            final_fields["grafana_panel_links"] = json.dumps(panel_links)
             logger.info(f"Successfully created Grafana dashboard for {deployment_name}")
         else:
             logger.warning(f"Could not generate Grafana dashboard for {deployment_name}. Panel links will be null.")
 
-        crud.update_deployment_status(db, deployment_name=deployment_name, status="Deployed")
-        return {"message": "Deployment successful."}
+        # Links and the final status are written in a single UPDATE.
+        await crud.update_deployment_status(db, deployment_name, "Deployed", **final_fields)
     except Exception as e:
-        crud.update_deployment_status(db, deployment_name=deployment_name, status="Failed")
-        detail = e.stderr if hasattr(e, 'stderr') else str(e)
-        raise HTTPException(status_code=500, detail=f"A step in the process failed: {detail[:1000]}...")
+        detail = failure_detail(e)
+        logger.error(f"Instrumentation of '{deployment_name}' failed: {detail}")
+        # The tail of the output (e.g. docker build) is where the error is.
+        await crud.update_deployment_status(db, deployment_name, "Failed", last_error=detail[-1000:])
@@ -0,0 +1,41 @@
+"""Initial deployments schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-15
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created before migrations existed already have this table
+    # (it used to be created with metadata.create_all at startup).
+    if not context.is_offline_mode() and sa.inspect(op.get_bind()).has_table("deployments"):
+        return
+    op.create_table(
+        "deployments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("deployment_name", sa.String(), nullable=False),
+        sa.Column("repo_url", sa.String(), nullable=False),
+        sa.Column("encrypted_pat_token", sa.String(), nullable=True),
+        sa.Column("language", sa.String(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("push_enabled", sa.Boolean(), nullable=False, server_default=sa.text("true")),
+        sa.Column("grafana_panel_links", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("last_updated", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_deployments_id", "deployments", ["id"])
+    op.create_index("ix_deployments_deployment_name", "deployments", ["deployment_name"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_deployments_deployment_name", table_name="deployments")
+    op.drop_index("ix_deployments_id", table_name="deployments")
+    op.drop_table("deployments")
@@ -0,0 +1,26 @@
+"""Covering index for the newest-first deployment list
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_deployment_created_desc",
+        "deployments",
+        [sa.text("created_at DESC")],
+        postgresql_include=["id", "deployment_name", "status"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_deployment_created_desc", table_name="deployments")
@@ -0,0 +1,21 @@
+"""Track the last checked-out commit per deployment
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("deployments", sa.Column("last_commit", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("deployments", "last_commit")
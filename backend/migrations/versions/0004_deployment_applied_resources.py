@@ -0,0 +1,21 @@
+"""Record the Kubernetes resources applied per deployment
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("deployments", sa.Column("applied_resources", sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("deployments", "applied_resources")
@@ -0,0 +1,21 @@
+"""Keep the error output of the last failed instrumentation run
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("deployments", sa.Column("last_error", sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("deployments", "last_error")
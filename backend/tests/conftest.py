@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from cryptography.fernet import Fernet
+from fastapi.testclient import TestClient
+
+# main reads its configuration at import time, so the test environment has
+# to be in place before any test module imports it.
+_test_dir = tempfile.mkdtemp(prefix="traceassist-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_test_dir}/traceassist.db")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+os.environ.setdefault("AUTO_CREATE_TABLES", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    import main
+
+    monkeypatch.setattr(main, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "inspect_repository", lambda *args, **kwargs: ("python", None))
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def create_deployment(client, name):
+    response = client.post("/deployments", json={"repo_url": "https://git.example.com/team/app.git", "deployment_name": name, "push_to_git": False})
+    assert response.status_code == 201
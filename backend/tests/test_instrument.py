@@ -0,0 +1,49 @@
+import subprocess
+
+import pytest
+
+import main
+from conftest import create_deployment
+
+
+@pytest.mark.parametrize(
+    "stderr, expected",
+    [
+        (None, "timed out after 60 seconds"),
+        (b"fatal: unable to access repository\xff", "fatal: unable to access repository�"),
+    ],
+)
+def test_timeout_marks_deployment_failed(client, monkeypatch, stderr, expected):
+    name = f"timeout-{'bytes' if stderr else 'none'}"
+    create_deployment(client, name)
+
+    def checkout_times_out(*args, **kwargs):
+        raise subprocess.TimeoutExpired(["git", "ls-remote"], 60, stderr=stderr)
+
+    monkeypatch.setattr(main, "checkout_repository", checkout_times_out)
+    response = client.post(f"/deployments/{name}/instrument")
+    assert response.status_code == 202
+
+    deployment = client.get(f"/deployments/{name}").json()
+    assert deployment["status"] == "Failed"
+    assert isinstance(deployment["last_error"], str)
+    assert expected in deployment["last_error"]
+    assert name not in main._instrument_runs
+    client.delete(f"/deployments/{name}")
+
+
+def test_instrument_refused_while_undeploying(client, monkeypatch, tmp_path):
+    name = "undeploy-busy"
+    create_deployment(client, name)
+    monkeypatch.setattr(main, "K8S_OUTPUT_DIR", str(tmp_path))
+    (tmp_path / f"{name}-deployment.yaml").write_text("kind: Deployment\n")
+    instrument_responses = []
+
+    def delete_while_instrumenting(manifest_files):
+        instrument_responses.append(client.post(f"/deployments/{name}/instrument").status_code)
+
+    monkeypatch.setattr(main, "delete_manifest_resources", delete_while_instrumenting)
+    response = client.delete(f"/deployments/{name}")
+    assert response.status_code == 200
+    assert instrument_responses == [409]
+    assert name not in main._instrument_runs
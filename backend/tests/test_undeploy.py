@@ -0,0 +1,34 @@
+import subprocess
+
+import pytest
+
+import main
+from conftest import create_deployment
+
+
+@pytest.fixture
+def manifest_dir(monkeypatch, tmp_path):
+    output_dir = tmp_path / "k8s-generated"
+    output_dir.mkdir()
+    monkeypatch.setattr(main, "K8S_OUTPUT_DIR", str(output_dir))
+    return output_dir
+
+
+def test_failed_manifest_delete_keeps_record(client, monkeypatch, manifest_dir):
+    name = "undeploy-timeout"
+    create_deployment(client, name)
+    manifest = manifest_dir / f"{name}-deployment.yaml"
+    manifest.write_text("kind: Deployment\n")
+
+    def kubectl_times_out(*args, **kwargs):
+        raise subprocess.TimeoutExpired(["kubectl", "delete"], 60)
+
+    monkeypatch.setattr(main.subprocess, "run", kubectl_times_out)
+    response = client.delete(f"/deployments/{name}")
+    assert response.status_code == 500
+    assert "timed out after 60 seconds" in response.json()["detail"]
+
+    deployment = client.get(f"/deployments/{name}").json()
+    assert deployment["status"] == "Undeploy Failed"
+    assert "timed out after 60 seconds" in deployment["last_error"]
+    assert manifest.exists()
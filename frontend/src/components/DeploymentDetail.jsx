@@ -159,6 +159,9 @@ export default function DeploymentDetail({ backendUrl, deploymentName, onDeploym
         </Box>
       )}
 
+      {details.last_error && details.status.toLowerCase().includes('failed') && (
+        <Alert severity="error" sx={{ mt: 2, whiteSpace: 'pre-wrap' }}>{details.last_error}</Alert>
+      )}
       {error && <Alert severity="error" sx={{ mt: 2 }}>{error}</Alert>}
     </Paper>
   );